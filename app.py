@@ -1,7 +1,34 @@
 import streamlit as st
-import pandas as pd
-from snowflake.snowpark import Session
+import os
+import math
 from datetime import datetime
+import time
+from snowflake_ops import (
+    get_session,
+    fetch_override_ref,
+    read_table_configs,
+    get_columns_by_table,
+    compute_common_columns,
+    fetch_data,
+    count_source_rows,
+    fetch_target_data,
+    count_target_rows,
+    clear_source_cache,
+    detect_changes,
+    fetch_submit_timestamp,
+    insert_into_target_table,
+    apply_source_merge,
+    is_valid_identifier,
+    is_plain_column,
+    SOURCE_ROWS_PER_PAGE,
+    OVERRIDE_ROWS_PER_PAGE,
+)
+
+# Custom CSS, read from disk once per server process
+@st.cache_resource(show_spinner=False)
+def _css():
+    with open(os.path.join(os.path.dirname(__file__), "static", "style.css")) as f:
+        return f"<style>{f.read()}</style>"
 
 # Page configuration
 st.set_page_config(
@@ -10,53 +37,9 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for styling
-st.markdown("""
-    <style>
-        .css-18e3th9 {background-color: #F0F2F6;}
-        .css-1kyxreq {border-radius: 12px; padding: 20px;}
-        .css-1b36jdy {text-align: center;}
-        .stButton>button {background-color: #1E88E5; color: white; border-radius: 5px; height: 40px;}
-        .stSelectbox>label {font-size: 16px;}
-        .stDataFrame {border: 1px solid #dddddd; border-radius: 8px;}
-        .module-box {
-            background-color: #D3E8FF;
-            padding: 15px;
-            border-radius: 8px;
-            font-size: 20px;
-            font-weight: bold;
-            text-align: center;
-        }
-        /* Tooltip CSS for styling */
-        .tooltip {
-            position: relative;
-            display: inline-block;
-            cursor: pointer;
-        }
-
-        .tooltip .tooltiptext {
-            visibility: hidden;
-            width: 250px;
-            background-color: #6c757d;
-            color: #fff;
-            text-align: center;
-            border-radius: 5px;
-            padding: 5px;
-            position: absolute;
-            z-index: 1;
-            bottom: 125%; /* Position above the button */
-            left: 50%;
-            margin-left: -125px; /* Centers the tooltip */
-            opacity: 0;
-            transition: opacity 0.3s;
-        }
-
-        .tooltip:hover .tooltiptext {
-            visibility: visible;
-            opacity: 1;
-        }
-    </style>
-""", unsafe_allow_html=True)
+# Custom CSS for styling. Streamlit rebuilds the page from scratch on every rerun, so the
+# style element is sent each time; skipping it after the first run would drop the styling
+st.markdown(_css(), unsafe_allow_html=True)
 
 # Title with custom styling
 st.markdown("<h1 style='text-align: center; color: #1E88E5;'>Override Dashboard</h1>", unsafe_allow_html=True)
@@ -65,99 +48,110 @@ st.markdown("<h1 style='text-align: center; color: #1E88E5;'>Override Dashboard<
 if 'last_update_time' not in st.session_state:
     st.session_state.last_update_time = "N/A"
 
-# Connect to Snowflake
-def connect_to_snowflake():
-    try:
-        connection_parameters = {
-            "account": st.secrets["SNOWFLAKE_ACCOUNT"],
-            "user": st.secrets["SNOWFLAKE_USER"],
-            "password": st.secrets["SNOWFLAKE_PASSWORD"],
-            "warehouse": st.secrets["SNOWFLAKE_WAREHOUSE"],
-            "database": st.secrets["SNOWFLAKE_DATABASE"],
-            "schema": st.secrets["SNOWFLAKE_SCHEMA"],
-        }
-        session = Session.builder.configs(connection_parameters).create()
-        st.success("✅ Successfully Connected to Snowflake")
-        return session
-    except Exception as e:
-        st.error(f"❌ Connection failed: {e}")
-        st.stop()
+# Version of the override log this session has seen; bumped whenever it should be re-read
+if 'target_version' not in st.session_state:
+    st.session_state.target_version = 0
 
-session = connect_to_snowflake()
+# Connect to Snowflake; the Session is shared across reruns and user sessions
+try:
+    session = get_session()
+except Exception as e:
+    st.error(f"❌ Connection failed: {e}")
+    st.stop()
 
-# Retrieve Configuration Data from Override_Ref
-def fetch_override_ref_data(module_number):
-    try:
-        df = session.sql(f"SELECT * FROM override_ref WHERE module = {module_number}").to_pandas()
-        return df
-    except Exception as e:
-        st.error(f"Error fetching Override_Ref data: {e}")
-        return pd.DataFrame()
+# Confirm the connection once per browser session rather than on every rerun
+if 'conn_logged' not in st.session_state:
+    st.session_state.conn_logged = True
+    st.success("✅ Successfully Connected to Snowflake")
 
-# Example - Assuming module number is passed via query parameters
+# The module is passed via query parameters, either by number (?module=3) or by name (?module_name=...)
 query_params = st.query_params
-module_number = query_params.get("module", 1)
+module_number = query_params.get("module")
+module_name = query_params.get("module_name")
 
-# Validate if module_number is a digit
+# Take the first element if either is a list
 if isinstance(module_number, list):
-    module_number = module_number[0]  # Take the first element if it's a list
-
-if not module_number.isdigit():
-    st.error("Invalid module number. Please provide a numeric value.")
-    st.stop()
-
-module_number = int(module_number)
+    module_number = module_number[0]
+if isinstance(module_name, list):
+    module_name = module_name[0]
+
+# Neither given: fall back to the first module
+if not module_number and not module_name:
+    module_number = "1"
+
+if module_number is not None:
+    # Validate if module_number is a digit
+    if not module_number.isdigit():
+        st.error("Invalid module number. Please provide a numeric value.")
+        st.stop()
+    module_number = int(module_number)
 
-override_ref_df = fetch_override_ref_data(module_number)
+override_ref_df = fetch_override_ref(session, module_number, module_name)
 
 if override_ref_df.empty:
     st.warning("No configuration data found in Override_Ref.")
     st.stop()
 
-# Display module name based on module_number
-module_name = override_ref_df['MODULE_NAME'].iloc[0] if 'MODULE_NAME' in override_ref_df.columns else f"Module {module_number}"
-st.markdown(f"<div class='module-box'>{module_name}</div>", unsafe_allow_html=True)
+# Display the module name, preferring the one recorded in Override_Ref
+display_name = override_ref_df['MODULE_NAME'].iloc[0] if 'MODULE_NAME' in override_ref_df.columns else (module_name or f"Module {module_number}")
+st.markdown(f"<div class='module-box'>{display_name}</div>", unsafe_allow_html=True)
+
+table_configs = read_table_configs(session, module_number, module_name)
 
 # Available table options
-available_tables = override_ref_df['SOURCE_TABLE'].unique()
+available_tables = list(table_configs)
 
 # Select a table from the dropdown
 selected_table = st.selectbox("Select Table", options=available_tables)
 
-# Retrieve table information for the selected table
-table_info_df = override_ref_df[override_ref_df['SOURCE_TABLE'] == selected_table]
+# Extract configuration data for the selected table
+config = table_configs[selected_table]
 
 # Fetch the description for the module from the Override_Ref table
-description = table_info_df['DESCRIPTION'].iloc[0] if 'DESCRIPTION' in table_info_df.columns else "No description available."
+description = config.get('DESCRIPTION', "No description available.")
 
-# Extract configuration data for the selected table
-config = override_ref_df[override_ref_df['SOURCE_TABLE'] == selected_table].iloc[0]
 source_table = config['SOURCE_TABLE']
 target_table = config['TARGET_TABLE']
 editable_column = config['EDITABLE_COLUMN'].strip().upper()
-join_keys = config['JOINING_KEYS'].strip().upper().split(',')
-
-# Function to fetch data from a given table
-def fetch_data(table_name):
-    try:
-        query = f"SELECT * FROM {table_name} WHERE RECORD_FLAG = 'A'"
-        df = session.sql(query).to_pandas()
-        df.columns = [col.strip().upper() for col in df.columns]
-        return df
-    except Exception as e:
-        st.error(f"Error fetching data from {table_name}: {e}")
-        return pd.DataFrame()
-
-# Function to fetch data from the target table
-def fetch_target_data(target_table):
-    try:
-        query = f"SELECT * FROM {target_table}"
-        df = session.sql(query).to_pandas()
-        df.columns = [col.strip().upper() for col in df.columns]
-        return df
-    except Exception as e:
-        st.error(f"Error fetching data from {target_table}: {e}")
-        return pd.DataFrame()
+join_keys = [key.strip() for key in config['JOINING_KEYS'].strip().upper().split(',')]
+
+# Identifiers from Override_Ref end up in SQL text; stop before any query if one is not a plain name
+invalid_identifiers = [name for name in [source_table, target_table, editable_column] + join_keys if not is_valid_identifier(name)]
+if invalid_identifiers:
+    st.error(f"❌ Invalid table or column names in Override_Ref: {', '.join(map(str, invalid_identifiers))}")
+    st.stop()
+
+# Table schemas are effectively static, so look the column lists up when the table is selected
+# rather than on every submit click
+try:
+    columns_by_table = get_columns_by_table(session, (source_table, target_table))
+    all_source_columns = tuple(columns_by_table[source_table.upper()])
+    target_columns = columns_by_table[target_table.upper()]
+    source_columns = [col for col in all_source_columns if col not in ('RECORD_FLAG', 'AS_AT_DATE', editable_column)]
+    common_columns = compute_common_columns(session, source_table, target_table, editable_column)
+except Exception as e:
+    st.error(f"Error fetching column metadata: {e}")
+    st.stop()
+
+# Override_Ref may list the columns worth showing for a table. The editor then fetches only those
+# plus what a submit needs: the keys, the editable value, the dates and the columns logged to the target
+display_columns = config.get('DISPLAY_COLUMNS')
+if isinstance(display_columns, str) and display_columns.strip():
+    required_columns = set(join_keys + [editable_column, 'AS_AT_DATE', 'AS_OF_DATE'] + [col.upper() for col in target_columns])
+    required_columns.update(col.strip().upper() for col in display_columns.split(','))
+    fetch_columns = tuple(col for col in all_source_columns if col.upper() in required_columns)
+    # The projection is pasted into SQL unquoted; with a quoted column among them, read every column instead
+    if not fetch_columns or not all(is_plain_column(col) for col in fetch_columns):
+        fetch_columns = None
+else:
+    fetch_columns = None
+
+# The search predicate names each column unquoted, so it covers only the plain-named ones
+search_columns = tuple(col for col in (fetch_columns or all_source_columns) if is_plain_column(col))
+
+# The source pager sorts on the join keys, then on every other plain column, so records that share
+# their keys still come back in one fixed order and no page repeats or skips a row
+source_order = tuple(join_keys) + tuple(col for col in search_columns if col not in join_keys)
 
 # Tabular Display
 tab1, tab2 = st.tabs(["Source Data", "Overridden Values"])
@@ -165,11 +159,6 @@ tab1, tab2 = st.tabs(["Source Data", "Overridden Values"])
 # Tab 1: Source Data
 with tab1:
     st.header(f"Source Data from {source_table}")
-    source_df = fetch_data(source_table)
-    
-    if source_df.empty:
-        st.warning("No data found in the source table.")
-        st.stop()
 
     # Display Editable Column
     st.markdown(f"Editable Column: {editable_column}")
@@ -177,166 +166,100 @@ with tab1:
     # Search box for filtering records
     search_filter = st.text_input("Search for records", placeholder="Enter search term")
 
-    # Filter records based on search query
-    if search_filter:
-        filtered_df = source_df[source_df.apply(lambda row: row.astype(str).str.contains(search_filter, case=False).any(), axis=1)]
-    else:
-        filtered_df = source_df
+    # Source reads are cached between reruns; this forces a fresh read from Snowflake
+    if st.button("Refresh source data"):
+        clear_source_cache()
+
+    # Keyed by table and search term, so picking another table or changing the search starts again at page 1
+    source_page_key = f"source_page_{source_table}_{search_filter}"
+    total_source_rows = count_source_rows(session, source_table, search_filter, search_columns)
+    source_page_count = max(1, math.ceil(total_source_rows / SOURCE_ROWS_PER_PAGE))
+    # A refresh can shrink the count below a page already chosen; clamp it before the widget renders
+    if st.session_state.get(source_page_key, 1) > source_page_count:
+        st.session_state[source_page_key] = source_page_count
+    source_page = st.number_input("Page", min_value=1, max_value=source_page_count, step=1, key=source_page_key)
+    st.caption(f"Page {source_page} of {source_page_count} • {total_source_rows} records")
+
+    # The search, paging and projection are applied in Snowflake, so only the records shown are transferred
+    source_df = fetch_data(session, source_table, source_order, int(source_page), search_filter, search_columns, fetch_columns)
 
-    # Create a copy of the filtered data for editing
-    editable_df = filtered_df.copy()
+    if source_df.empty and not search_filter and source_page == 1:
+        st.warning("No data found in the source table.")
+        st.stop()
+    elif source_df.empty:
+        st.warning("No records match the search." if source_page == 1 else "No records on this page.")
 
     # Ensure editable column exists in the source data
     if editable_column not in source_df.columns:
         st.error(f"Editable column '{editable_column}' not found in source table.")
         st.stop()
 
-    # Highlight the editable column and make it editable
-    edited_data = st.data_editor(
-        editable_df,
-        column_config={
-            editable_column: st.column_config.NumberColumn(f"{editable_column} (Editable)✏️")
-        },
-        disabled=[col for col in editable_df.columns if col != editable_column],
-        use_container_width=True,
-        hide_index=True  # Remove the index column
-    )
-
-    # Submit Updates Button
-    st.markdown(f'<div class="tooltip">Hover to see description<span class="tooltiptext">{description}</span></div>', unsafe_allow_html=True)
-
-    if st.button("Submit Updates"):
-        # Function to identify changes and insert into target table dynamically
-        def insert_into_target_table(session, source_df, edited_data, target_table, editable_column, join_keys):
-            try:
-                changes_df = edited_data[edited_data[editable_column] != source_df[editable_column]]
-                
-                if changes_df.empty:
-                    st.info("No changes detected. No records to insert.")
-                    return
-
-                target_columns_query = f"""
-                    SELECT COLUMN_NAME
-                    FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{target_table.upper()}'
-                """
-                target_columns = [row['COLUMN_NAME'].upper() for row in session.sql(target_columns_query).to_pandas().to_dict('records')]
-                common_columns = [col for col in source_df.columns if col in target_columns and col not in [editable_column, 'AS_AT_DATE', 'RECORD_FLAG','AS_OF_DATE']]
-                
-                # Iterate over the changes and insert into the target table
-                for _, row in changes_df.iterrows():
-                    old_value = source_df.loc[source_df.index == row.name, editable_column].values[0]
-                    new_value = row[editable_column]
-                    as_at_date = row['AS_AT_DATE']
-                    as_of_date = row['AS_OF_DATE']
-                     # Fetch the current timestamp dynamically
-                    #current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    columns_to_insert = ', '.join(common_columns + ['AS_OF_DATE','SRC_INS_TS', f'{editable_column}_OLD', f'{editable_column}_NEW', 'RECORD_FLAG', 'AS_AT_DATE'])
-                    values_to_insert = []
-                    for col in common_columns:
-                        value = row[col]
-                        if pd.isna(value):  
-                            values_to_insert.append('NULL')  
-                        elif isinstance(value, str):
-                            value = value.replace("'", "''")
-                            values_to_insert.append(f"'{value}'")  
-                        else:
-                            values_to_insert.append(str(value))  
-
-                    values_to_insert_str = ', '.join(values_to_insert)
-
-                    insert_sql = f"""
-                        INSERT INTO {target_table} ({columns_to_insert})
-                        VALUES (
-                            {values_to_insert_str},'{as_of_date}','{as_at_date}', {old_value}, {new_value}, 'O', CURRENT_TIMESTAMP()
-                        )
-                    """
-                    try:
-                        session.sql(insert_sql).collect()
-                    except Exception as e:
-                        st.error(f"❌ Error inserting record: {e}")
-                        st.error(f"SQL Query: {insert_sql}")
-                        raise
-
-            except Exception as e:
-                st.error(f"❌ Error inserting into {target_table}: {e}")
-
-        # Single 'Submit Changes' button
-        def insert_into_source_table(session, target_table, source_table, editable_column, join_keys):
-            try:
-                target_columns_query = f"""
-                    SELECT COLUMN_NAME
-                    FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE UPPER(TABLE_NAME) = '{source_table.upper()}'
-                      AND COLUMN_NAME NOT IN ('RECORD_FLAG', 'AS_AT_DATE', '{editable_column.upper()}')
-                """
-                common_columns = [row['COLUMN_NAME'].upper() for row in session.sql(target_columns_query).to_pandas().to_dict('records')]
-
-                if not common_columns:
-                    st.error("No matching common columns found between target and source.")
-                    return
-
-                columns_to_insert = ', '.join(common_columns + [editable_column, 'RECORD_FLAG', 'AS_AT_DATE'])
-                insert_sql = f"""
-                    INSERT INTO {source_table} ({columns_to_insert})
-                    SELECT
-                        {', '.join([f"src.{col}" for col in common_columns])},
-                        src.{editable_column}_NEW,
-                        'A',
-                        CURRENT_TIMESTAMP(0)
-                    FROM {target_table} src
-                    JOIN {source_table} tgt
-                    ON {" AND ".join([f"COALESCE(tgt.{key}, '') = COALESCE(src.{key}, '')"  for key in join_keys])}
-                    AND tgt.{editable_column} = src.{editable_column}_OLD
-                    WHERE tgt.RECORD_FLAG = 'A';
-                """
-
-                session.sql(insert_sql).collect()
-
-            except Exception as e:
-                st.error(f"❌ Error inserting into {source_table}: {e}")
-
-        # Function to update the old record in the source table
-        def update_old_record(session, target_table, source_table, editable_column, join_keys):
-            try:
-                join_condition = " AND ".join([
-                    f"COALESCE(tgt.{key}, '') = COALESCE(src.{key}, '')"  
-                    for key in join_keys
-                ])
-
-                update_sql = f"""
-                    UPDATE {source_table} tgt
-                    SET record_flag = 'D'
-                    FROM {target_table} src
-                    WHERE {join_condition}
-                      AND tgt.{editable_column} = src.{editable_column}_OLD
-                      AND tgt.record_flag = 'A';
-                """
-
-                session.sql(update_sql).collect()
-
-            except Exception as e:
-                st.error(f"❌ Error updating old records in {source_table}: {e}")
-
-        # Step 1: Insert into target table (fact_portfolio_perf_override)
-        insert_into_target_table(session, source_df, edited_data, target_table, editable_column, join_keys)
-
-        # Step 2: Insert into source table (fact_portfolio_perf)
-        insert_into_source_table(session, target_table, source_table, editable_column, join_keys)
-
-        # Step 3: Update old records in source table (fact_portfolio_perf)
-        update_old_record(session, target_table, source_table, editable_column, join_keys)
-
-        # Update the last update time in session state
-        st.session_state.last_update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        st.success("✅ Data updated successfully👍!")
+    # The editor sits in a form, so cell edits are batched in the browser and the script
+    # only reruns when Submit Updates is clicked
+    with st.form("edit_form"):
+        # Highlight the editable column and make it editable. st.data_editor returns a new frame
+        # and never mutates its input, so source_df is passed as-is rather than copied first
+        edited_data = st.data_editor(
+            source_df,
+            column_config={
+                editable_column: st.column_config.NumberColumn(f"{editable_column} (Editable)✏️")
+            },
+            disabled=[col for col in source_df.columns if col != editable_column],
+            use_container_width=True,
+            hide_index=True  # Remove the index column
+        )
+
+        # Submit Updates Button
+        st.markdown(f'<div class="tooltip">Hover to see description<span class="tooltiptext">{description}</span></div>', unsafe_allow_html=True)
+
+        submitted = st.form_submit_button("Submit Updates")
+
+    if submitted:
+        # Clicking Submit without editing is the common case: the change mask is computed once
+        # here and decides it before any frame is filtered or any statement is sent
+        mask = detect_changes(source_df, edited_data, editable_column)
+
+        if not mask.any():
+            st.info("No changes detected. No records to insert.")
+        elif not source_columns:
+            # Checked before step 1, so a submit that cannot update the source writes no audit rows either
+            st.error("No matching common columns found between target and source.")
+        else:
+            # Step 1: Insert into target table (fact_portfolio_perf_override)
+            as_at_date = fetch_submit_timestamp(session)
+            changed_keys_df = None if as_at_date is None else insert_into_target_table(session, source_df, edited_data, mask, target_table, editable_column, join_keys, common_columns, as_at_date)
+
+            # Step 2: Retire the old records and insert the new ones in the source table (fact_portfolio_perf)
+            if changed_keys_df is not None and apply_source_merge(session, source_table, editable_column, join_keys, source_columns, changed_keys_df, as_at_date):
+                # Drop cached source reads and move to a new override-log version so both tabs show the new state
+                clear_source_cache()
+                st.session_state.target_version = time.time()
+
+                # Update the last update time in session state
+                st.session_state.last_update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+                st.success("✅ Data updated successfully👍!")
 
 # Tab 2: Overridden Values
 with tab2:
     st.header(f"Overridden Values in {target_table}")
-    overridden_data = fetch_target_data(target_table)  
+
+    # Reruns from the other tab are served from the cache; this forces a fresh read
+    if st.button("Refresh overridden values"):
+        st.session_state.target_version = time.time()
+
+    # COUNT(*) is answered from table metadata, so the page total costs no scan of the log
+    total_rows = count_target_rows(session, target_table, st.session_state.target_version)
+    page_count = max(1, math.ceil(total_rows / OVERRIDE_ROWS_PER_PAGE))
+    # Keyed per target table: the page count differs between tables, and a page kept from a
+    # larger table could otherwise sit above this table's max_value
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key=f"override_page_{target_table}")
+    st.caption(f"Page {page} of {page_count} • {total_rows} overridden records")
+    # Rows of one submit share AS_AT_DATE; the join keys (or, without them, every column) break the tie
+    override_tiebreak = [key for key in join_keys if key in target_columns] or target_columns
+    overridden_data = fetch_target_data(session, target_table, int(page), st.session_state.target_version, override_tiebreak)
     if overridden_data.empty:
-        st.warning("No overridden data found in the target table.")
+        st.warning("No overridden data found in the target table." if page == 1 else "No overridden data on this page.")
     else:
         st.dataframe(overridden_data, use_container_width=True)
 
@@ -0,0 +1,437 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from snowflake.snowpark import Session
+import io
+import re
+import uuid
+
+# pandas 2 can keep Arrow-backed columns as they are (pd.ArrowDtype) instead of copying them into NumPy
+ARROW_DTYPES_SUPPORTED = int(pd.__version__.split('.')[0]) >= 2
+
+# Override batches larger than this are staged as Parquet and loaded with COPY INTO
+STAGE_UPLOAD_THRESHOLD_BYTES = 3 * 1024 * 1024
+
+# Override batches up to this many rows are sent as a single INSERT ... VALUES statement
+VALUES_INSERT_MAX_ROWS = 100
+
+# Number of source records loaded into the data editor per page
+SOURCE_ROWS_PER_PAGE = 500
+
+# Number of override records shown per page in the Overridden Values tab
+OVERRIDE_ROWS_PER_PAGE = 100
+
+# Search terms shorter than this do not filter the source table
+MIN_SEARCH_LENGTH = 2
+
+# Table and column names are interpolated into SQL text, so only plain unquoted identifiers are accepted
+IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+# Function to check that a name from Override_Ref is a plain identifier and safe to put in SQL
+def is_valid_identifier(name):
+    return isinstance(name, str) and IDENTIFIER_PATTERN.match(name) is not None
+
+# Function to check that a column name as stored in INFORMATION_SCHEMA can be referenced unquoted.
+# Unquoted identifiers are stored upper-case, so a quoted "Fund Name" or "FundName" fails this
+def is_plain_column(name):
+    return is_valid_identifier(name) and name == name.upper()
+
+# Function to tell whether a cached Session can still be used. It is checked on every cache hit,
+# so it only inspects local connection state rather than pinging Snowflake with a query
+def _session_is_alive(session):
+    return not session.connection.is_closed()
+
+# Connect to Snowflake once per server process; every rerun and every user session reuses the
+# Session, and a closed one is transparently replaced by a new connection
+@st.cache_resource(show_spinner=False, validate=_session_is_alive)
+def get_session():
+    connection_parameters = {
+        "account": st.secrets["SNOWFLAKE_ACCOUNT"],
+        "user": st.secrets["SNOWFLAKE_USER"],
+        "password": st.secrets["SNOWFLAKE_PASSWORD"],
+        "warehouse": st.secrets["SNOWFLAKE_WAREHOUSE"],
+        "database": st.secrets["SNOWFLAKE_DATABASE"],
+        "schema": st.secrets["SNOWFLAKE_SCHEMA"],
+        # The Session is long-lived, so keep it from expiring between interactions
+        "client_session_keep_alive": True,
+        # Reads and executemany run on the connector's own cursor with ? placeholders, which the
+        # connector only binds server-side under qmark (executemany then uses array binding);
+        # its default pyformat would %-format them on the client
+        "paramstyle": "qmark",
+    }
+    return Session.builder.configs(connection_parameters).create()
+
+# Function to run a query and assemble the result from the connector's Arrow batches,
+# so the pandas frame is built batch by batch as the result set streams in. With arrow_dtypes
+# the columns stay in the Arrow buffers (strings are not copied into Python objects); that suits
+# frames that are only displayed, not edited or compared
+def query_to_pandas(session, query, params=None, arrow_dtypes=False):
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(query, params)
+        columns = [col.name for col in cursor.description]
+        if arrow_dtypes and ARROW_DTYPES_SUPPORTED:
+            # fetch_arrow_all returns None rather than an empty table when there are no rows
+            table = cursor.fetch_arrow_all()
+            batches = [] if table is None else [table.to_pandas(types_mapper=pd.ArrowDtype)]
+        else:
+            batches = list(cursor.fetch_pandas_batches())
+    finally:
+        cursor.close()
+
+    if len(batches) == 1:
+        df = batches[0]
+    else:
+        df = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=columns)
+    # Normalise column names once, with vectorised string ops on the Index
+    df.columns = df.columns.str.strip().str.upper()
+    return df
+
+# Function to store text columns compactly instead of as one Python string object per cell:
+# repetitive ones as categoricals (a small array of labels plus integer codes), the rest as
+# Arrow-backed strings, which Streamlit can hand to the browser without converting them first
+def compact_text_columns(df, max_unique_ratio=0.5):
+    for col in df.select_dtypes('object').columns:
+        # Object columns can also hold Decimals or dates; only genuine text is converted
+        if pd.api.types.infer_dtype(df[col], skipna=True) != 'string':
+            continue
+        if len(df) and df[col].nunique() / len(df) < max_unique_ratio:
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = df[col].astype('string[pyarrow]')
+    return df
+
+# Cached Snowflake reads; the session argument is underscored so Streamlit does not hash it.
+# Exceptions propagate out of these, so a failed query is never cached.
+@st.cache_data(ttl=300, show_spinner=False)
+def _read_override_ref(_session, module_number=None, module_name=None):
+    # A module is addressed by its number or, when no number is given, by its name
+    if module_number is not None:
+        return _session.sql("SELECT * FROM override_ref WHERE module = ?", params=[module_number]).to_pandas()
+    return _session.sql("SELECT * FROM override_ref WHERE module_name = ?", params=[module_name]).to_pandas()
+
+# Configuration rows keyed by source table (first row wins), so a table selection is a dict lookup
+@st.cache_data(ttl=300, show_spinner=False)
+def read_table_configs(_session, module_number=None, module_name=None):
+    df = _read_override_ref(_session, module_number, module_name)
+    return df.drop_duplicates('SOURCE_TABLE').set_index('SOURCE_TABLE', drop=False).to_dict('index')
+
+# Function to build the WHERE clause and bind values shared by the source page and count queries
+def _source_filter(table_name, search=None, search_columns=()):
+    where_sql = "WHERE RECORD_FLAG = 'A'"
+    params = [table_name]
+    if search:
+        # Case-insensitive substring match on every column; the term is bound, never interpolated
+        pattern = "%" + search.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%"
+        conditions = " OR ".join(f"{col}::STRING ILIKE ? ESCAPE '!'" for col in search_columns)
+        where_sql += f" AND ({conditions})"
+        params += [pattern] * len(search_columns)
+    return where_sql, params
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _read_source_data(_session, table_name, order_by, page=1, search=None, search_columns=(), columns=None):
+    # The table name is bound through IDENTIFIER(?), so the query text is shared by every table.
+    # Snowflake stores columns separately, so projecting a wide table scans and ships only those
+    where_sql, params = _source_filter(table_name, search, search_columns)
+    query = f"SELECT {', '.join(columns) if columns else '*'} FROM IDENTIFIER(?) {where_sql}"
+    # One stable page of records at a time, so the editor never receives the whole table
+    offset = (page - 1) * SOURCE_ROWS_PER_PAGE
+    query += f" ORDER BY {', '.join(order_by)} LIMIT {SOURCE_ROWS_PER_PAGE} OFFSET {offset}"
+    df = query_to_pandas(_session, query, params)
+    return compact_text_columns(df)
+
+# Number of active (and, when searching, matching) source records, for the page count
+@st.cache_data(ttl=300, show_spinner=False)
+def _count_source_rows(_session, table_name, search=None, search_columns=()):
+    where_sql, params = _source_filter(table_name, search, search_columns)
+    return _session.sql(f"SELECT COUNT(*) FROM IDENTIFIER(?) {where_sql}", params=params).collect()[0][0]
+
+# The override log is only viewed, so it is cached for a short time. `version` is part of the
+# cache key only: bumping st.session_state.target_version makes this session read fresh data
+# without evicting other sessions' cached pages
+@st.cache_data(ttl=60, show_spinner=False)
+def _read_target_data(_session, target_table, page=1, version=0, tiebreak=()):
+    # One page of the newest overrides; the browser grid never receives the whole history.
+    # A submit stamps all its rows with the same AS_AT_DATE, so `tiebreak` columns keep the order
+    # stable within a batch and a batch crossing a page boundary is neither repeated nor skipped
+    offset = (page - 1) * OVERRIDE_ROWS_PER_PAGE
+    order_by = ', '.join(['AS_AT_DATE DESC'] + list(tiebreak))
+    query = f"SELECT * FROM IDENTIFIER(?) ORDER BY {order_by} LIMIT {OVERRIDE_ROWS_PER_PAGE} OFFSET {offset}"
+    return query_to_pandas(_session, query, [target_table], arrow_dtypes=True)
+
+# Number of records in the override log, for the page count; cached and versioned like the pages
+@st.cache_data(ttl=60, show_spinner=False)
+def _count_target_rows(_session, target_table, version=0):
+    return _session.sql("SELECT COUNT(*) FROM IDENTIFIER(?)", params=[target_table]).collect()[0][0]
+
+# Column names of several tables in one INFORMATION_SCHEMA round-trip, keyed by upper-cased
+# table name; used for the search predicate and to line up source and target columns on submit
+@st.cache_data(ttl=24 * 3600, show_spinner=False)
+def get_columns_by_table(_session, table_names):
+    table_names = [name.upper() for name in table_names]
+    columns_query = f"""
+        SELECT UPPER(TABLE_NAME), COLUMN_NAME
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND UPPER(TABLE_NAME) IN ({', '.join(['?'] * len(table_names))})
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """
+    columns_by_table = {name: [] for name in table_names}
+    # Names are kept as stored, so quoted mixed-case or spaced names can be told apart from plain ones
+    for row in _session.sql(columns_query, params=table_names).collect():
+        columns_by_table[row[0]].append(row[1])
+    return columns_by_table
+
+# Columns copied unchanged from a source record into its override record, in source-table order.
+# They depend only on the two schemas, so they are worked out once rather than on every submit
+@st.cache_data(ttl=24 * 3600, show_spinner=False)
+def compute_common_columns(_session, source_table, target_table, editable_column):
+    columns_by_table = get_columns_by_table(_session, (source_table, target_table))
+    target_cols = set(columns_by_table[target_table.upper()])
+    excluded = {editable_column, 'AS_AT_DATE', 'RECORD_FLAG', 'AS_OF_DATE'}
+    return [col for col in columns_by_table[source_table.upper()] if col in target_cols and col not in excluded]
+
+# Retrieve Configuration Data from Override_Ref
+def fetch_override_ref(session, module_number=None, module_name=None):
+    try:
+        return _read_override_ref(session, module_number, module_name)
+    except Exception as e:
+        st.error(f"Error fetching Override_Ref data: {e}")
+        return pd.DataFrame()
+
+# Function to fetch data from a given table, filtered in Snowflake when a search term is given
+def fetch_data(session, table_name, order_by, page=1, search=None, search_columns=(), columns=None):
+    try:
+        order_by = tuple(order_by)
+        if not search or len(search) < MIN_SEARCH_LENGTH:
+            return _read_source_data(session, table_name, order_by, page, columns=columns)
+
+        if not search_columns:
+            # Column list unavailable: filter the fetched page client-side instead
+            return filter_records(_read_source_data(session, table_name, order_by, page, columns=columns), search)
+        return _read_source_data(session, table_name, order_by, page, search, search_columns, columns)
+    except Exception as e:
+        st.error(f"Error fetching data from {table_name}: {e}")
+        return pd.DataFrame()
+
+# Function to count the source records the pager walks through. It mirrors fetch_data: a search
+# that fetch_data applies client-side, page by page, does not narrow the pages, so it is not counted
+def count_source_rows(session, table_name, search=None, search_columns=()):
+    try:
+        if not search or len(search) < MIN_SEARCH_LENGTH or not search_columns:
+            return _count_source_rows(session, table_name)
+        return _count_source_rows(session, table_name, search, tuple(search_columns))
+    except Exception as e:
+        st.error(f"Error counting records in {table_name}: {e}")
+        return 0
+
+# Function to fetch data from the target table
+def fetch_target_data(session, target_table, page=1, version=0, tiebreak=()):
+    try:
+        return _read_target_data(session, target_table, page, version, tuple(tiebreak))
+    except Exception as e:
+        st.error(f"Error fetching data from {target_table}: {e}")
+        return pd.DataFrame()
+
+# Function to count the records in the target table
+def count_target_rows(session, target_table, version=0):
+    try:
+        return _count_target_rows(session, target_table, version)
+    except Exception as e:
+        st.error(f"Error counting records in {target_table}: {e}")
+        return 0
+
+# Function to drop every cached page of source records, e.g. after the source table changed
+def clear_source_cache():
+    _read_source_data.clear()
+    _count_source_rows.clear()
+
+# Function to filter records whose text in any column contains the search term
+def filter_records(df, search_term):
+    # Single characters match almost every row, so they are not worth a scan
+    if not search_term or len(search_term) < MIN_SEARCH_LENGTH:
+        return df
+
+    # One vectorised plain-substring match per column instead of a Python callback per row
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Match the distinct labels only, then map the result back through the codes (-1 = missing)
+            label_mask = np.asarray(values.cat.categories.astype(str).str.contains(search_term, case=False, regex=False), dtype=bool)
+            mask |= np.append(label_mask, False)[values.cat.codes.to_numpy()]
+        else:
+            mask |= values.astype("string").str.contains(search_term, case=False, na=False, regex=False).to_numpy(dtype=bool)
+    return df[mask]
+
+# Function to insert a frame with one prepared INSERT ... VALUES statement. executemany sends all
+# rows as bound arrays in a single request, so nothing is quoted or escaped by hand and the
+# statement text is the same however many rows there are; None/NaN/NA are bound as NULL.
+# Array binding needs the qmark paramstyle set on the connection in get_session
+def insert_rows_with_values(session, df, table_name):
+    insert_sql = f"INSERT INTO {table_name} ({', '.join(df.columns)}) VALUES ({', '.join(['?'] * len(df.columns))})"
+    rows = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+
+    cursor = session.connection.cursor()
+    try:
+        cursor.executemany(insert_sql, rows)
+    finally:
+        cursor.close()
+
+# Function to submit a best-effort clean-up statement without waiting for it. Submitting can fail
+# itself (e.g. on a dropped connection); that is ignored so it never replaces the error being handled
+def submit_cleanup(session, sql):
+    try:
+        session.sql(sql).collect_nowait()
+    except Exception:
+        pass
+
+# Function to append a frame to an existing table using the cheapest load path for its size
+def load_rows(session, df, table_name):
+    if len(df) <= VALUES_INSERT_MAX_ROWS:
+        # The usual handful of edits: one bound INSERT ... VALUES round-trip beats the
+        # temporary stage, PUT and COPY that write_pandas performs
+        insert_rows_with_values(session, df, table_name)
+    elif df.memory_usage(deep=True).sum() > STAGE_UPLOAD_THRESHOLD_BYTES:
+        # Large change sets: upload one Parquet file to the user stage and load it with COPY INTO
+        stage_path = f"@~/override_stage/{uuid.uuid4().hex}.parquet"
+        parquet_buf = io.BytesIO()
+        df.to_parquet(parquet_buf, index=False)
+        parquet_buf.seek(0)
+        session.file.put_stream(parquet_buf, stage_path, auto_compress=False, overwrite=True)
+
+        copy_sql = f"""
+            COPY INTO {table_name}
+            FROM {stage_path}
+            FILE_FORMAT = (TYPE = PARQUET USE_LOGICAL_TYPE = TRUE)
+            MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+            PURGE = TRUE
+        """
+        try:
+            session.sql(copy_sql).collect()
+        except Exception:
+            # PURGE only removes files that were loaded, so a failed COPY would leave the upload behind
+            submit_cleanup(session, f"REMOVE {stage_path}")
+            raise
+    else:
+        session.write_pandas(
+            df,
+            table_name,
+            auto_create_table=False,
+            overwrite=False,
+            quote_identifiers=False,
+            use_logical_type=True
+        )
+
+# Function to read the Snowflake clock once per submit, so the override rows and the source
+# records they replace carry the same AS_AT_DATE. It is taken as the session's wall-clock time,
+# which is what CURRENT_TIMESTAMP() has always written into the existing history
+def fetch_submit_timestamp(session):
+    try:
+        return session.sql("SELECT CURRENT_TIMESTAMP()::TIMESTAMP_NTZ").collect()[0][0]
+    except Exception as e:
+        st.error(f"❌ Error reading the current time from Snowflake: {e}")
+        return None
+
+# Function to flag the edited rows whose editable value differs from the source record.
+# It compares the raw NumPy buffers; NaN on both sides counts as unchanged
+def detect_changes(source_df, edited_data, editable_column):
+    old_values = source_df.loc[edited_data.index, editable_column].to_numpy()
+    new_values = edited_data[editable_column].to_numpy()
+    return (old_values != new_values) & ~(pd.isna(old_values) & pd.isna(new_values))
+
+# Function to insert the changed rows, flagged by detect_changes, into target table dynamically
+def insert_into_target_table(session, source_df, edited_data, mask, target_table, editable_column, join_keys, common_columns, as_at_date):
+    try:
+        changes_df = edited_data.iloc[mask]
+        old_values = source_df.loc[changes_df.index, editable_column].to_numpy()
+        new_values = changes_df[editable_column].to_numpy()
+
+        # Build all override rows in a single frame instead of one INSERT per row
+        override_df = changes_df[common_columns + ['AS_OF_DATE']].copy()
+        override_df['SRC_INS_TS'] = changes_df['AS_AT_DATE']
+        override_df[f'{editable_column}_OLD'] = old_values
+        override_df[f'{editable_column}_NEW'] = new_values
+        override_df['RECORD_FLAG'] = 'O'
+        override_df['AS_AT_DATE'] = pd.Timestamp(as_at_date)
+
+        load_rows(session, override_df, target_table)
+
+        # Keys and values of the changed rows, which drive the source MERGE
+        return changes_df[join_keys].assign(**{
+            f'{editable_column}_OLD': old_values,
+            f'{editable_column}_NEW': new_values,
+        })
+
+    except Exception as e:
+        st.error(f"❌ Error inserting into {target_table}: {e}")
+
+# Function to replace the overridden source records in a single MERGE: the active record
+# is flagged 'D' and a new active record carrying the new value is inserted. Only the
+# changed rows' keys and values are uploaded, into a temporary table typed like the source,
+# so the MERGE joins that small table instead of the whole override history
+def apply_source_merge(session, source_table, editable_column, join_keys, common_columns, changed_keys_df, as_at_date):
+    staging_table = f"OVERRIDE_CHANGES_{uuid.uuid4().hex.upper()}"
+    try:
+        create_sql = f"""
+            CREATE TEMPORARY TABLE {staging_table} AS
+            SELECT {', '.join(join_keys)},
+                {editable_column} AS {editable_column}_OLD,
+                {editable_column} AS {editable_column}_NEW
+            FROM {source_table}
+            LIMIT 0
+        """
+        session.sql(create_sql).collect()
+        load_rows(session, changed_keys_df, staging_table)
+
+        # EQUAL_NULL is Snowflake's null-safe equality; unlike COALESCE(key, '') it keeps the
+        # key's type and leaves the comparison usable for pruning
+        def join_condition(left, right):
+            return " AND ".join([f"EQUAL_NULL({left}.{key}, {right}.{key})" for key in join_keys])
+
+        columns_to_insert = ', '.join(common_columns + [editable_column, 'RECORD_FLAG', 'AS_AT_DATE'])
+        # Each changed record is listed twice: the IS_UPDATE copy closes the active
+        # record, the other copy never matches and inserts its replacement
+        merge_sql = f"""
+            MERGE INTO {source_table} tgt
+            USING (
+                SELECT chg.*, act.IS_UPDATE
+                FROM (
+                    SELECT DISTINCT
+                        {', '.join([f"cur.{col}" for col in common_columns])},
+                        chg.{editable_column}_OLD,
+                        chg.{editable_column}_NEW
+                    FROM {staging_table} chg
+                    JOIN {source_table} cur
+                    ON {join_condition('cur', 'chg')}
+                    AND EQUAL_NULL(cur.{editable_column}, chg.{editable_column}_OLD)
+                    WHERE cur.RECORD_FLAG = 'A'
+                ) chg
+                CROSS JOIN (SELECT TRUE AS IS_UPDATE UNION ALL SELECT FALSE) act
+            ) src
+            ON src.IS_UPDATE
+            AND {join_condition('tgt', 'src')}
+            AND EQUAL_NULL(tgt.{editable_column}, src.{editable_column}_OLD)
+            AND tgt.RECORD_FLAG = 'A'
+            WHEN MATCHED THEN
+                UPDATE SET RECORD_FLAG = 'D'
+            WHEN NOT MATCHED THEN
+                INSERT ({columns_to_insert})
+                VALUES (
+                    {', '.join([f"src.{col}" for col in common_columns])},
+                    src.{editable_column}_NEW,
+                    'A',
+                    ?
+                );
+        """
+
+        session.sql(merge_sql, params=[as_at_date]).collect()
+        return True
+
+    except Exception as e:
+        st.error(f"❌ Error merging into {source_table}: {e}")
+        return False
+
+    finally:
+        # The cached Session outlives this submit, so its temporary table is dropped explicitly.
+        # Nothing waits on the DROP, so it is submitted without blocking the rerun on its round-trip
+        submit_cleanup(session, f"DROP TABLE IF EXISTS {staging_table}")